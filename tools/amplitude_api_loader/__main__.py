@@ -0,0 +1,10 @@
+"""
+Точка входа: python -m amplitude_api_loader
+Запускает ежедневную выгрузку событий (см. export_events.py)
+"""
+
+from .export_events import main
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,15 @@
 """
 
 import os
-import requests
 import zipfile
 import gzip
 import json
 from datetime import datetime, timedelta
 from typing import Optional
 import sys
-from dotenv import load_dotenv
-from tqdm import tqdm
 
-# Загружаем переменные окружения из .env файла
-load_dotenv()
+# requests, tqdm, pandas и dotenv импортируются в методах,
+# чтобы импорт модуля не замедлял запуск CLI
 
 
 class AmplitudeClient:
@@ -23,6 +20,12 @@ class AmplitudeClient:
     
     def __init__(self, show_progress: bool = True):
         """Инициализация клиента с кредами из .env"""
+        import requests
+        from dotenv import load_dotenv
+
+        # Загружаем переменные окружения из .env файла
+        load_dotenv()
+
         self.api_key = os.getenv('AMPLITUDE_API_KEY')
         self.secret_key = os.getenv('AMPLITUDE_SECRET_KEY')
         self.show_progress = show_progress
@@ -84,6 +87,7 @@ class AmplitudeClient:
         
         with open(output_file, 'wb') as f:
             if show_progress and total_size > 0:
+                from tqdm import tqdm
                 with tqdm(
                     desc=f"Скачивание {start_date}",
                     total=total_size,
@@ -160,6 +164,7 @@ class AmplitudeClient:
             # Обрабатываем JSON файлы
             all_data = []
             if show_progress:
+                from tqdm import tqdm
                 json_files_iter = tqdm(json_files, desc="Обработка файлов")
             else:
                 json_files_iter = json_files
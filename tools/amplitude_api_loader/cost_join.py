@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Потоковое соединение событий Amplitude со стоимостью задач генерации
+Считает юнит-экономику по пользователям и тарифам без загрузки данных целиком в память
+"""
+
+import os
+import sys
+import csv
+import ast
+import json
+import zlib
+import shutil
+import argparse
+import tempfile
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+
+# Колонки таблицы из add_cost_info_to_tasks (generation_cost_analysis.ipynb)
+TASK_ID_COLUMN = 'task_id'
+TASK_DATE_COLUMN = 'task_date'
+TASK_COST_COLUMN = 'allocated_cost_per_task'
+TASK_SUCCESS_COLUMN = 'success'
+
+# Формат строк в файлах партиций
+TASK_PARTITION_FIELDS = ['task_id', 'cost', 'success', 'day']
+EVENT_PARTITION_FIELDS = ['task_id', 'user_id', 'plan']
+SEEN_PARTITION_FIELDS = ['task_id']
+
+USER_COST_FIELDS = [
+    'user_id', 'plan', 'generations', 'successful', 'failed',
+    'total_cost', 'cost_per_generation'
+]
+PLAN_COST_FIELDS = [
+    'plan', 'users', 'generations', 'successful', 'failed',
+    'total_cost', 'cost_per_generation', 'cost_per_user'
+]
+
+
+def _parse_properties(value: str) -> dict:
+    """Разбор event_properties / user_properties из CSV выгрузки (JSON или repr словаря)"""
+    if not value:
+        return {}
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def _shift_day(day: str, days: int) -> str:
+    """Сдвиг даты в формате YYYY-MM-DD на заданное число дней"""
+    return (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+class _PartitionWriter:
+    """
+    Раскладывает строки по CSV файлам партиций с ограничением открытых файлов
+
+    При достижении лимита закрывается только давно не использованный файл (LRU),
+    поэтому вход не по порядку дат не приводит к постоянному переоткрытию файлов.
+    Лимит держится ниже типичного ulimit -n (1024).
+    """
+
+    def __init__(self, directory: str, fields: List[str], max_open_files: int = 256):
+        self.directory = directory
+        self.fields = fields
+        self.max_open_files = max_open_files
+        self.files = OrderedDict()
+        self.paths = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, key: str, row: list):
+        if key in self.files:
+            self.files.move_to_end(key)
+        else:
+            if len(self.files) >= self.max_open_files:
+                _, (oldest, _) = self.files.popitem(last=False)
+                oldest.close()
+            path = os.path.join(self.directory, f"{key}.csv")
+            is_new = key not in self.paths
+            f = open(path, 'a', newline='', encoding='utf-8')
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(self.fields)
+            self.files[key] = (f, writer)
+            self.paths[key] = path
+        self.files[key][1].writerow(row)
+
+    def close(self):
+        for f, _ in self.files.values():
+            f.close()
+        self.files = OrderedDict()
+
+
+def _read_partition(paths: Iterable[str]):
+    """Построчное чтение файлов партиций"""
+    for path in paths:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+
+class EventCostJoiner:
+    """
+    Hash join событий генерации из Amplitude со стоимостью задач
+
+    Обе стороны раскладываются по дням на диск. Для каждого дня строится
+    хеш-таблица задач (build) за этот, предыдущий и следующий день и по ней
+    проходят события дня (probe): event_time в выгрузке Amplitude в UTC, а
+    task_date - локальная дата создания задачи, и генерация после полуночи
+    может попасть в соседний день с любой стороны. Если задач в партиции больше max_build_rows,
+    партиция дробится по хешу task_id и обрабатывается по частям.
+
+    Каждая задача учитывается один раз: повторные события с тем же task_id
+    (started/completed, ретраи, событие в соседний день) отбрасываются.
+    Сопоставленные задачи сохраняются на диск по task_date и дробятся вместе
+    с build стороной при обработке следующих дней.
+    """
+
+    def __init__(
+        self,
+        event_types: Optional[Iterable[str]] = None,
+        task_id_property: str = 'task_id',
+        plan_property: str = 'plan',
+        max_build_rows: int = 1_000_000,
+        spill_fanout: int = 16,
+        max_spill_depth: int = 4,
+        show_progress: bool = True
+    ):
+        """
+        Args:
+            event_types: Типы событий генерации (по умолчанию - все события с task_id, каждая задача учитывается один раз)
+            task_id_property: Ключ task_id в event_properties
+            plan_property: Ключ тарифа в user_properties
+            max_build_rows: Максимум задач в хеш-таблице в памяти
+            spill_fanout: На сколько частей дробить партицию при сбросе на диск
+            max_spill_depth: Максимальная глубина дробления (защита от дублей task_id)
+            show_progress: Выводить ход выполнения
+        """
+        self.event_types = set(event_types) if event_types else None
+        self.task_id_property = task_id_property
+        self.plan_property = plan_property
+        self.max_build_rows = max_build_rows
+        self.spill_fanout = spill_fanout
+        self.max_spill_depth = max_spill_depth
+        self.show_progress = show_progress
+
+        # Агрегаты по (user_id, plan): [generations, successful, failed, total_cost]
+        self.user_costs: Dict[tuple, list] = {}
+        self.stats = {
+            'tasks': 0,
+            'events': 0,
+            'events_without_task_id': 0,
+            'matched': 0,
+            'unmatched': 0,
+            'duplicates': 0,
+            'spilled_partitions': 0,
+            'oversized_partitions': 0,
+        }
+
+        # Сопоставленные задачи по task_date (для отсева дублей в соседние дни)
+        self._current_day = None
+        self._warned_day = None
+        self._seen_writer = None
+
+    def _log(self, message: str):
+        if self.show_progress:
+            print(message)
+            sys.stdout.flush()
+
+    def partition_tasks(self, tasks_csv: str, directory: str) -> Dict[str, str]:
+        """
+        Разложить стоимость задач по дням
+
+        Args:
+            tasks_csv: CSV из add_cost_info_to_tasks
+            directory: Директория для партиций
+
+        Returns:
+            Словарь день -> путь к файлу партиции
+        """
+        writer = _PartitionWriter(directory, TASK_PARTITION_FIELDS)
+        try:
+            with open(tasks_csv, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    day = (row.get(TASK_DATE_COLUMN) or '')[:10]
+                    if not day:
+                        continue
+                    writer.write(day, [
+                        row[TASK_ID_COLUMN],
+                        row.get(TASK_COST_COLUMN) or 0,
+                        row.get(TASK_SUCCESS_COLUMN, ''),
+                        day
+                    ])
+                    self.stats['tasks'] += 1
+        finally:
+            writer.close()
+        return writer.paths
+
+    def partition_events(self, events_csvs: Iterable[str], directory: str) -> Dict[str, str]:
+        """
+        Разложить события генерации по дням
+
+        Args:
+            events_csvs: CSV файлы из AmplitudeClient.get_events_for_date_range
+            directory: Директория для партиций
+
+        Returns:
+            Словарь день -> путь к файлу партиции
+        """
+        writer = _PartitionWriter(directory, EVENT_PARTITION_FIELDS)
+        try:
+            for events_csv in events_csvs:
+                with open(events_csv, 'r', newline='', encoding='utf-8') as f:
+                    for row in csv.DictReader(f):
+                        if self.event_types and row.get('event_type') not in self.event_types:
+                            continue
+                        self.stats['events'] += 1
+
+                        task_id = _parse_properties(row.get('event_properties')).get(self.task_id_property)
+                        day = (row.get('event_time') or '')[:10]
+                        if task_id is None or not day:
+                            self.stats['events_without_task_id'] += 1
+                            continue
+
+                        plan = _parse_properties(row.get('user_properties')).get(self.plan_property)
+                        writer.write(day, [task_id, row.get('user_id') or '', plan or ''])
+        finally:
+            writer.close()
+        return writer.paths
+
+    def _spill(self, paths: List[str], fields: List[str], directory: str, depth: int) -> Dict[str, str]:
+        """Раздробить партицию по хешу task_id"""
+        writer = _PartitionWriter(directory, fields)
+        # На каждом уровне берутся другие биты хеша, иначе строки бакета не разойдутся
+        divisor = self.spill_fanout ** depth
+        try:
+            for row in _read_partition(paths):
+                bucket = zlib.crc32(row['task_id'].encode()) // divisor % self.spill_fanout
+                writer.write(str(bucket), [row[field] for field in fields])
+        finally:
+            writer.close()
+        return writer.paths
+
+    def _join(
+        self,
+        build_paths: List[str],
+        probe_paths: List[str],
+        seen_paths: List[str],
+        spill_dir: str,
+        depth: int = 0
+    ):
+        """Соединить партицию задач (build) с партицией событий (probe)"""
+        table = {}
+        overflow = False
+        for row in _read_partition(build_paths):
+            table[row['task_id']] = (float(row['cost'] or 0), row['success'] == 'True', row['day'])
+            if len(table) > self.max_build_rows:
+                if depth < self.max_spill_depth:
+                    overflow = True
+                    break
+                if len(table) == self.max_build_rows + 1:
+                    self.stats['oversized_partitions'] += 1
+                    if self._warned_day == self._current_day:
+                        continue
+                    self._warned_day = self._current_day
+                    print(
+                        f"ВНИМАНИЕ: партиции за {self._current_day} превышают max_build_rows "
+                        f"({self.max_build_rows}) на максимальной глубине дробления "
+                        f"({self.max_spill_depth}) и загружаются в память целиком (всего - stats['oversized_partitions'])",
+                        file=sys.stderr
+                    )
+                    sys.stderr.flush()
+
+        if overflow:
+            # Не помещается в память - дробим все стороны и обрабатываем по частям
+            table = None
+            self.stats['spilled_partitions'] += 1
+            level_dir = tempfile.mkdtemp(dir=spill_dir)
+            try:
+                build_parts = self._spill(build_paths, TASK_PARTITION_FIELDS, os.path.join(level_dir, 'tasks'), depth)
+                probe_parts = self._spill(probe_paths, EVENT_PARTITION_FIELDS, os.path.join(level_dir, 'events'), depth)
+                seen_parts = self._spill(seen_paths, SEEN_PARTITION_FIELDS, os.path.join(level_dir, 'seen'), depth)
+                for bucket, probe_path in probe_parts.items():
+                    if bucket in build_parts:
+                        bucket_seen = [seen_parts[bucket]] if bucket in seen_parts else []
+                        self._join([build_parts[bucket]], [probe_path], bucket_seen, level_dir, depth + 1)
+                    else:
+                        self._count_unmatched([probe_path])
+            finally:
+                shutil.rmtree(level_dir, ignore_errors=True)
+            return
+
+        # Задачи, уже учтенные за предыдущий день
+        seen = {row['task_id'] for row in _read_partition(seen_paths) if row['task_id'] in table}
+
+        for row in _read_partition(probe_paths):
+            task_id = row['task_id']
+            task = table.get(task_id)
+            if task is None:
+                self.stats['unmatched'] += 1
+                continue
+            if task_id in seen:
+                self.stats['duplicates'] += 1
+                continue
+            seen.add(task_id)
+            self.stats['matched'] += 1
+
+            cost, success, task_day = task
+            self._seen_writer.write(task_day, [task_id])
+
+            key = (row['user_id'], row['plan'])
+            agg = self.user_costs.get(key)
+            if agg is None:
+                agg = self.user_costs[key] = [0, 0, 0, 0.0]
+            agg[0] += 1
+            agg[1 if success else 2] += 1
+            agg[3] += cost
+
+    def _count_unmatched(self, probe_paths: List[str]):
+        for _ in _read_partition(probe_paths):
+            self.stats['unmatched'] += 1
+
+    def run(self, events_csvs: Iterable[str], tasks_csv: str, spill_dir: Optional[str] = None):
+        """
+        Полный цикл: партиционирование и соединение по дням
+
+        Args:
+            events_csvs: CSV файлы с событиями Amplitude
+            tasks_csv: CSV со стоимостью задач
+            spill_dir: Директория для временных файлов (по умолчанию - системная)
+
+        Returns:
+            Агрегаты по (user_id, plan)
+        """
+        # Свойства событий Amplitude могут быть длиннее стандартного лимита csv
+        csv.field_size_limit(2 ** 31 - 1)
+
+        work_dir = tempfile.mkdtemp(prefix='cost_join_', dir=spill_dir)
+        try:
+            self._log("ЭТАП 1 из 3: Партиционирование стоимости задач по дням")
+            task_parts = self.partition_tasks(tasks_csv, os.path.join(work_dir, 'tasks'))
+            self._log(f"Задач: {self.stats['tasks']}, дней: {len(task_parts)}")
+
+            self._log("ЭТАП 2 из 3: Партиционирование событий по дням")
+            event_parts = self.partition_events(events_csvs, os.path.join(work_dir, 'events'))
+            self._log(f"Событий: {self.stats['events']}, дней: {len(event_parts)}")
+
+            self._log("ЭТАП 3 из 3: Соединение по дням")
+            self._seen_writer = _PartitionWriter(os.path.join(work_dir, 'seen'), SEEN_PARTITION_FIELDS)
+            try:
+                for day in sorted(event_parts):
+                    # Задачи соседних дней: event_time в UTC, task_date - локальная дата
+                    window = (_shift_day(day, -1), day, _shift_day(day, 1))
+                    build_paths = [task_parts[d] for d in window if d in task_parts]
+
+                    # Задачи окна, уже учтенные в предыдущие дни
+                    self._seen_writer.close()
+                    seen_paths = [self._seen_writer.paths[d] for d in window if d in self._seen_writer.paths]
+
+                    self._current_day = day
+                    if build_paths:
+                        self._join(build_paths, [event_parts[day]], seen_paths, work_dir)
+                    else:
+                        self._count_unmatched([event_parts[day]])
+
+                    self._log(
+                        f"  {day}: сопоставлено {self.stats['matched']}, без задачи {self.stats['unmatched']}, "
+                        f"дублей {self.stats['duplicates']}"
+                    )
+            finally:
+                self._seen_writer.close()
+                self._seen_writer = None
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return self.user_costs
+
+    def plan_costs(self) -> Dict[str, list]:
+        """Агрегаты по тарифам: [users, generations, successful, failed, total_cost]"""
+        plans = {}
+        for (_, plan), (generations, successful, failed, total_cost) in self.user_costs.items():
+            agg = plans.setdefault(plan, [0, 0, 0, 0, 0.0])
+            agg[0] += 1
+            agg[1] += generations
+            agg[2] += successful
+            agg[3] += failed
+            agg[4] += total_cost
+        return plans
+
+    def save(self, output_dir: str) -> tuple:
+        """
+        Сохранить агрегаты по пользователям и тарифам в CSV
+
+        Args:
+            output_dir: Директория для сохранения
+
+        Returns:
+            Пути к CSV файлам (пользователи, тарифы)
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        users_csv = os.path.join(output_dir, 'user_costs.csv')
+        plans_csv = os.path.join(output_dir, 'plan_costs.csv')
+
+        with open(users_csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(USER_COST_FIELDS)
+            for (user_id, plan), (generations, successful, failed, total_cost) in self.user_costs.items():
+                writer.writerow([
+                    user_id, plan, generations, successful, failed,
+                    round(total_cost, 6), round(total_cost / generations, 6)
+                ])
+
+        with open(plans_csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(PLAN_COST_FIELDS)
+            for plan, (users, generations, successful, failed, total_cost) in sorted(self.plan_costs().items()):
+                writer.writerow([
+                    plan, users, generations, successful, failed, round(total_cost, 6),
+                    round(total_cost / generations, 6), round(total_cost / users, 6)
+                ])
+
+        return users_csv, plans_csv
+
+
+def main():
+    """Основная функция скрипта"""
+    parser = argparse.ArgumentParser(description='Стоимость генераций по пользователям и тарифам')
+    parser.add_argument(
+        '--events',
+        type=str,
+        nargs='+',
+        required=True,
+        help='CSV файлы с событиями Amplitude'
+    )
+    parser.add_argument(
+        '--tasks',
+        type=str,
+        required=True,
+        help='CSV со стоимостью задач (tasks_raw_detailed_enhanced.csv)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=str,
+        help='Директория для сохранения (по умолчанию - amplitude/unit_economics)',
+        default=os.path.join('amplitude', 'unit_economics')
+    )
+    parser.add_argument(
+        '--event-type',
+        type=str,
+        action='append',
+        help='Тип события генерации (можно указать несколько раз)',
+        default=None
+    )
+    parser.add_argument(
+        '--task-id-property',
+        type=str,
+        help='Ключ task_id в event_properties',
+        default='task_id'
+    )
+    parser.add_argument(
+        '--plan-property',
+        type=str,
+        help='Ключ тарифа в user_properties',
+        default='plan'
+    )
+    parser.add_argument(
+        '--max-build-rows',
+        type=int,
+        help='Максимум задач в памяти, при превышении - сброс на диск',
+        default=1_000_000
+    )
+    parser.add_argument(
+        '--spill-dir',
+        type=str,
+        help='Директория для временных файлов',
+        default=None
+    )
+    parser.add_argument(
+        '--no-progress',
+        action='store_true',
+        help='Отключить вывод хода выполнения (для продакшна)',
+        default=False
+    )
+
+    args = parser.parse_args()
+    show_progress = not args.no_progress
+
+    try:
+        joiner = EventCostJoiner(
+            event_types=args.event_type,
+            task_id_property=args.task_id_property,
+            plan_property=args.plan_property,
+            max_build_rows=args.max_build_rows,
+            show_progress=show_progress
+        )
+        joiner.run(args.events, args.tasks, spill_dir=args.spill_dir)
+        users_csv, plans_csv = joiner.save(args.output_dir)
+
+        if show_progress:
+            print("\n" + "=" * 60)
+            print("СОЕДИНЕНИЕ ЗАВЕРШЕНО УСПЕШНО!")
+            print("=" * 60)
+            print(f"Сопоставлено событий: {joiner.stats['matched']}")
+            print(f"Без задачи: {joiner.stats['unmatched']}")
+            print(f"Без task_id: {joiner.stats['events_without_task_id']}")
+            print(f"Дублей task_id: {joiner.stats['duplicates']}")
+            print(f"Сбросов на диск: {joiner.stats['spilled_partitions']}")
+            print(f"Партиций сверх лимита: {joiner.stats['oversized_partitions']}")
+            print(f"Пользователи: {users_csv}")
+            print(f"Тарифы: {plans_csv}")
+            print("=" * 60)
+
+    except Exception as e:
+        if show_progress:
+            print(f"\nОШИБКА: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,7 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
-from amplitude.amplitude_client import AmplitudeClient
+from amplitude_api_loader.amplitude_client import AmplitudeClient
 
 
 def example_basic_export():
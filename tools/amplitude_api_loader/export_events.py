@@ -2,26 +2,47 @@
 """
 Скрипт для выгрузки событий из Amplitude за сутки
 Использует Amplitude Export API для получения данных
+Запуск: python -m amplitude_api_loader или python amplitude_api_loader/export_events.py
 """
 
+import time
+
+# Отсчет времени запуска модуля CLI (без старта интерпретатора)
+_start_time = time.perf_counter()
+
 import os
 import sys
-import json
 import argparse
 from datetime import datetime, timedelta
 from pathlib import Path
-from tqdm import tqdm
-import pandas as pd
-from dotenv import load_dotenv
 
-# Загружаем переменные окружения из .env файла
-load_dotenv()
+# pandas, requests, tqdm и dotenv импортируются на тех этапах, где они нужны
+# (.env загружает AmplitudeClient), чтобы --help и небольшие выгрузки из cron запускались быстро
 
-# Добавляем корневую директорию проекта в путь
+# Корневая директория проекта (родитель пакета amplitude_api_loader)
 project_root = Path(__file__).parent.parent
-sys.path.append(str(project_root))
 
-from amplitude.amplitude_client import AmplitudeClient
+
+def _process_uptime():
+    """Время с запуска процесса в секундах (Linux, точность - тик часов), None если недоступно"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _import_client():
+    """Ленивый импорт AmplitudeClient (из пакета или при запуске как скрипта)"""
+    if __package__:
+        from .amplitude_client import AmplitudeClient
+    else:
+        sys.path.append(str(Path(__file__).parent))
+        from amplitude_client import AmplitudeClient
+    return AmplitudeClient
 
 
 def setup_output_directory(show_progress: bool = True) -> Path:
@@ -65,6 +86,7 @@ def export_events_for_date(
         sys.stdout.flush()
     
     # Инициализация клиента
+    AmplitudeClient = _import_client()
     client = AmplitudeClient(show_progress=show_progress)
     
     # Выгрузка данных
@@ -93,6 +115,8 @@ def process_exported_data(csv_file: str, show_progress: bool = True) -> str:
         print(f"ЭТАП 6 из 6: Проверка данных из {csv_file}")
         sys.stdout.flush()
     
+    import pandas as pd
+
     # Чтение CSV данных для проверки
     df = pd.read_csv(csv_file, low_memory=False)
     
@@ -147,6 +171,14 @@ def main():
     
     args = parser.parse_args()
     
+    # Время запуска: с начала процесса (интерпретатор + импорты) и отдельно модуль CLI
+    cli_ms = (time.perf_counter() - _start_time) * 1000
+    process_uptime = _process_uptime()
+    if process_uptime is not None:
+        startup_info = f"{process_uptime * 1000:.0f} мс с начала процесса (модуль CLI {cli_ms:.0f} мс)"
+    else:
+        startup_info = f"{cli_ms:.0f} мс (модуль CLI, без старта интерпретатора)"
+    
     # Определение даты
     if args.date:
         target_date = args.date
@@ -161,12 +193,17 @@ def main():
         print("AMPLITUDE EVENTS EXPORT")
         print("=" * 60)
         print(f"Дата: {target_date}")
+        print(f"Запуск: {startup_info}")
         if args.event_type:
             print(f"Тип события: {args.event_type}")
         if args.user_id:
             print(f"Пользователь: {args.user_id}")
         print("=" * 60)
         sys.stdout.flush()
+    else:
+        # В режиме cron (--no-progress) время запуска пишется одной строкой в stderr
+        print(f"amplitude export {target_date}: запуск {startup_info}", file=sys.stderr)
+        sys.stderr.flush()
     
     try:
         # Настройка директории
@@ -193,6 +230,7 @@ def main():
             print("=" * 60)
             print(f"JSON файл: {json_file}")
             print(f"CSV файл: {csv_file}")
+            print(f"Время выполнения: {time.perf_counter() - _start_time:.1f} с")
             print("=" * 60)
         
     except Exception as e:
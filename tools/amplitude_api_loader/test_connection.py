@@ -16,7 +16,7 @@ load_dotenv()
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
-from amplitude.amplitude_client import AmplitudeClient
+from amplitude_api_loader.amplitude_client import AmplitudeClient
 
 
 def test_amplitude_connection():